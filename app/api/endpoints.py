@@ -1,15 +1,13 @@
-import time
 import logging
-from functools import lru_cache
-from datetime import datetime, timezone
-from typing import List, Any, Dict, Optional
+from time import perf_counter, time_ns
+from typing import List, Any, Dict
 
-from fastapi import APIRouter, Query, HTTPException, status
+import orjson
+from fastapi import APIRouter, Query, HTTPException, Response, status
 from pydantic import BaseModel, Field
 
-from app.services.data_processing import get_stats, find_records_by_value, get_dataframe
-from app.core.config import settings
-import polars as pl
+from app.api.responses import ORJSONResponse
+from app.services.data_processing import DataStore, data_store, get_stats
 
 # Configurar un logger específico para este módulo
 logger = logging.getLogger(__name__)
@@ -17,6 +15,10 @@ logger = logging.getLogger(__name__)
 # Crear un router de FastAPI para organizar los endpoints
 router = APIRouter()
 
+def _now_ms() -> int:
+    """Devuelve el instante actual en milisegundos desde epoch (UTC), como entero."""
+    return time_ns() // 1_000_000
+
 # --- Modelos de Respuesta (Pydantic) ---
 # Usar Pydantic nos asegura que las respuestas de la API siempre tengan una estructura consistente.
 
@@ -31,25 +33,47 @@ class StatsResponse(BaseModel):
     memory_usage_mb: float
     schema: Dict[str, str]
 
+class CountResponse(BaseModel):
+    total_records: int
+    query_time_ms: float
+    timestamp: int = Field(
+        default_factory=_now_ms,
+        description="Momento de la respuesta, en milisegundos desde epoch (UTC).",
+    )
+
 class FilterResponse(BaseModel):
     data: List[Dict[str, Any]]
     total_records: int
     query_time_ms: float
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    timestamp: int = Field(
+        default_factory=_now_ms,
+        description="Momento de la respuesta, en milisegundos desde epoch (UTC).",
+    )
 
 
 # --- Implementación de los Endpoints ---
+# Los endpoints devuelven directamente un `ORJSONResponse` con datos construidos por el
+# propio servidor, por lo que FastAPI no vuelve a validarlos con Pydantic.
+# `response_model` se mantiene en cada ruta para documentar el esquema en OpenAPI.
+
+# Resultado (JSON de los registros, total) para valores que no existen en el índice.
+_EMPTY_RESULT = (b"[]", 0)
+
+# La respuesta del health check es siempre la misma, así que se serializa una sola vez.
+_HEALTH_OK_BODY = orjson.dumps(
+    HealthResponse(message="Servicio operativo y datos cargados.").model_dump()
+)
 
 @router.get("/health", response_model=HealthResponse, tags=["Monitoring"])
 async def health_check():
     """
     Endpoint de Health Check.
 
-    Verifica si el DataFrame principal ha sido cargado en memoria.
+    Verifica si la carga de datos en memoria ha terminado.
     Esencial para sistemas de monitoreo (como Kubernetes liveness/readiness probes).
     """
-    if get_dataframe() is not None:
-        return HealthResponse(message="Servicio operativo y datos cargados.")
+    if data_store.ready:
+        return Response(content=_HEALTH_OK_BODY, media_type="application/json")
     else:
         # Si los datos no están cargados, el servicio no está listo para recibir tráfico.
         raise HTTPException(
@@ -66,39 +90,29 @@ async def get_dataset_stats():
     """
     stats_data = get_stats()
     if stats_data:
-        return StatsResponse(**stats_data)
+        return ORJSONResponse(stats_data)
     else:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Las estadísticas no están disponibles. Los datos aún no se han cargado.",
         )
 
-# LRU Cache para la función de búsqueda.
-# maxsize=1024 significa que guardará los resultados de las 1024 consultas más recientes.
-# Esto es extremadamente útil si los usuarios consultan los mismos valores repetidamente.
-@lru_cache(maxsize=1024)
-def _execute_filter(value: Any) -> Optional[Dict[str, Any]]:
+def _coerce_filter_value(store: DataStore, value: str) -> Any:
     """
-    Función interna para ejecutar el filtro, decorada con caché.
+    Convierte el valor recibido al tipo de la columna de filtro, resuelto al crear el índice.
 
-    Args:
-        value: El valor a buscar.
-
-    Returns:
-        Un diccionario con los datos encontrados o None.
+    Raises:
+        HTTPException: 422 si el valor no se puede convertir al tipo de la columna.
     """
-    logger.debug(f"Ejecutando búsqueda en el índice para el valor: {value}")
-    # find_records_by_value hace la búsqueda O(1) en nuestro hash map
-    result_df = find_records_by_value(value)
-
-    if result_df is None or result_df.is_empty():
-        return None
-
-    # Convertimos el DataFrame de Polars a una lista de diccionarios
-    return {
-        "data": result_df.to_dicts(),
-        "total_records": len(result_df)
-    }
+    try:
+        return store.coerce(value)
+    except (ValueError, TypeError):
+        # Se usa el código literal: el nombre de la constante cambió entre versiones de
+        # Starlette (`HTTP_422_UNPROCESSABLE_ENTITY` / `HTTP_422_UNPROCESSABLE_CONTENT`).
+        raise HTTPException(
+            status_code=422,
+            detail=f"El valor '{value}' no es válido para el campo de filtro '{store.filter_field}'.",
+        )
 
 @router.get("/data/filter", response_model=FilterResponse, tags=["Data"])
 async def filter_data(value: str = Query(..., description="Valor a buscar en el campo de filtro configurado.")):
@@ -107,47 +121,69 @@ async def filter_data(value: str = Query(..., description="Valor a buscar en el
 
     Busca registros donde el campo `FILTER_FIELD_NAME` (configurado en el entorno)
     coincide con el `value` proporcionado. La respuesta es casi instantánea
-    gracias al índice en memoria y la caché LRU.
+    gracias al índice en memoria y al JSON pre-serializado de cada clave.
     """
-    start_time = time.perf_counter()
+    start_time = perf_counter()
+
+    # Tomamos referencias locales al almacén una sola vez por petición.
+    store = data_store
+    payload_cache = store.payload_cache
 
     # Validar que los datos estén cargados antes de proceder
-    if get_dataframe() is None:
+    if payload_cache is None:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="El servicio no está listo para realizar consultas.",
         )
 
-    # La columna de filtro puede ser numérica. Intentamos convertir el valor.
-    # Esta es una heurística simple. Una implementación más robusta podría
-    # inspeccionar el tipo de dato de la columna del DataFrame.
-    filter_value: Any = value
-    try:
-        # Primero intenta convertir a entero
-        filter_value = int(value)
-    except ValueError:
-        try:
-            # Si falla, intenta convertir a flotante
-            filter_value = float(value)
-        except ValueError:
-            # Si ambos fallan, se queda como string
-            pass
-
-    # Llamamos a la función cacheada
-    result = _execute_filter(filter_value)
-
-    end_time = time.perf_counter()
+    filter_value = _coerce_filter_value(store, value)
+
+    # La búsqueda en el índice es una simple consulta a un diccionario, sin locks
+    # ni caché adicional: el JSON de cada clave ya está precalculado. Los valores
+    # inexistentes se resuelven con el mismo acceso, devolviendo un resultado vacío fijo.
+    payload, total_records = payload_cache.get(filter_value, _EMPTY_RESULT)
+
+    end_time = perf_counter()
     query_time = (end_time - start_time) * 1000  # Convertir a milisegundos
 
-    if not result:
-        return FilterResponse(
-            data=[],
-            total_records=0,
-            query_time_ms=query_time
+    # Los registros ya están serializados, así que los insertamos tal cual en la
+    # respuesta (orjson.Fragment).
+    return ORJSONResponse({
+        "data": orjson.Fragment(payload),
+        "total_records": total_records,
+        "query_time_ms": query_time,
+        "timestamp": _now_ms(),
+    })
+
+@router.get("/data/count", response_model=CountResponse, tags=["Data"])
+async def count_data(value: str = Query(..., description="Valor a contar en el campo de filtro configurado.")):
+    """
+    Endpoint de conteo de registros.
+
+    Devuelve cuántos registros tienen el campo `FILTER_FIELD_NAME` igual al `value`
+    proporcionado, sin materializar ni serializar ningún registro: el número sale
+    directamente de la longitud guardada en el índice.
+    """
+    start_time = perf_counter()
+
+    store = data_store
+    payload_cache = store.payload_cache
+
+    if payload_cache is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="El servicio no está listo para realizar consultas.",
         )
 
-    return FilterResponse(
-        data=result["data"],
-        total_records=result["total_records"],
-        query_time_ms=query_time
-    )
+    filter_value = _coerce_filter_value(store, value)
+
+    # El índice guarda el total de registros de cada clave junto a su JSON.
+    _, total_records = payload_cache.get(filter_value, _EMPTY_RESULT)
+
+    query_time = (perf_counter() - start_time) * 1000  # Convertir a milisegundos
+
+    return ORJSONResponse({
+        "total_records": total_records,
+        "query_time_ms": query_time,
+        "timestamp": _now_ms(),
+    })
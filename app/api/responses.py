@@ -0,0 +1,16 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    Respuesta JSON serializada con orjson en lugar del módulo `json` estándar.
+
+    orjson está implementado en Rust, es mucho más rápido con listas de diccionarios
+    y permite insertar JSON ya serializado mediante `orjson.Fragment`.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
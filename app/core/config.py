@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
-from typing import Optional
+from typing import List, Optional
 
 class Settings(BaseSettings):
     """
@@ -26,12 +26,24 @@ class Settings(BaseSettings):
         None,
         description="Cadena de conexión de Azure. Opcional, pero necesaria si no se usa DefaultAzureCredential."
     )
+    ADLS_DOWNLOAD_CONCURRENCY: int = Field(
+        8,
+        description="Número de peticiones de rango simultáneas al descargar el archivo Parquet desde ADLS."
+    )
+    PARQUET_DOWNLOAD_DIR: Optional[str] = Field(
+        None,
+        description="Directorio local donde se descarga temporalmente el archivo Parquet. Si no se indica, se usa el directorio temporal del sistema."
+    )
 
     # --- Configuración de la aplicación ---
     FILTER_FIELD_NAME: str = Field(
         ...,
         description="El nombre de la columna en el archivo Parquet que se usará para filtrar y crear un índice en memoria."
     )
+    PROJECTION_COLUMNS: Optional[List[str]] = Field(
+        None,
+        description="Columnas del archivo Parquet que se cargan en memoria (lista JSON). Si no se indica, se cargan todas. Debe incluir FILTER_FIELD_NAME."
+    )
     LOG_LEVEL: str = Field(
         "INFO",
         description="Nivel de logging para la aplicación (e.g., DEBUG, INFO, WARNING, ERROR)."
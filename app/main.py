@@ -1,12 +1,14 @@
 import logging
 import logging.config
-import time
+from time import perf_counter
 import sys
 
+import uvicorn
+
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
 
 from app.api.endpoints import router as api_router
+from app.api.responses import ORJSONResponse
 from app.core.config import settings
 from app.services.data_processing import load_data_into_memory
 
@@ -42,6 +44,8 @@ app = FastAPI(
     title="FastAPI High-Speed Parquet Query Service",
     description="Un microservicio para consultar datos de un archivo Parquet en ADLS a alta velocidad.",
     version="1.0.0",
+    # Serializamos las respuestas con orjson en lugar del módulo `json` estándar.
+    default_response_class=ORJSONResponse,
 )
 
 # --- Middleware de Rendimiento y Logging ---
@@ -51,23 +55,25 @@ async def add_process_time_header(request: Request, call_next):
     Middleware para medir el tiempo de procesamiento de cada solicitud
     y para loggear información de la solicitud y respuesta.
     """
-    start_time = time.perf_counter()
+    start_time = perf_counter()
 
     # Procesar la solicitud
     response = await call_next(request)
 
-    process_time_ms = (time.perf_counter() - start_time) * 1000
-    response.headers["X-Process-Time-Ms"] = f"{process_time_ms:.2f}"
+    process_time_ms = f"{(perf_counter() - start_time) * 1000:.2f}"
+    response.headers["X-Process-Time-Ms"] = process_time_ms
 
-    logger.info(
-        "Request handled",
-        extra={
-            "method": request.method,
-            "path": request.url.path,
-            "status_code": response.status_code,
-            "process_time_ms": f"{process_time_ms:.2f}",
-        },
-    )
+    # Evitamos construir el diccionario `extra` si el nivel INFO está deshabilitado.
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Request handled",
+            extra={
+                "method": request.method,
+                "path": request.url.path,
+                "status_code": response.status_code,
+                "process_time_ms": process_time_ms,
+            },
+        )
     return response
 
 # --- Eventos de Ciclo de Vida de la Aplicación ---
@@ -99,3 +105,17 @@ async def read_root():
     Endpoint raíz que redirige a la documentación de la API.
     """
     return {"message": "Bienvenido al servicio de consulta de datos. Visite /docs para la documentación de la API."}
+
+# --- Punto de Entrada ---
+if __name__ == "__main__":
+    # uvloop y httptools son las implementaciones en C del event loop y del parser HTTP
+    # (incluidas en `uvicorn[standard]`), más rápidas que las de asyncio y h11.
+    # Cada worker es un proceso independiente con su propia copia de los datos en memoria.
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=settings.APP_PORT,
+        workers=settings.APP_WORKERS,
+        loop="uvloop",
+        http="httptools",
+    )
@@ -1,5 +1,6 @@
-import io
+import os
 import logging
+import tempfile
 from azure.storage.filedatalake.aio import DataLakeServiceClient
 from azure.identity.aio import DefaultAzureCredential
 from tenacity import retry, stop_after_attempt, wait_exponential
@@ -42,9 +43,14 @@ async def get_adls_client() -> DataLakeServiceClient:
     wait=wait_exponential(multiplier=1, min=4, max=10),  # Espera exponencial entre reintentos
     reraise=True # Volver a lanzar la excepción si todos los reintentos fallan
 )
-async def download_parquet_file_to_buffer(client: DataLakeServiceClient) -> io.BytesIO:
+async def download_parquet_file_to_path(client: DataLakeServiceClient) -> str:
     """
-    Descarga el archivo Parquet desde ADLS a un buffer en memoria.
+    Descarga el archivo Parquet desde ADLS a un archivo temporal en disco.
+
+    El archivo se descarga con varias peticiones de rango en paralelo
+    (`ADLS_DOWNLOAD_CONCURRENCY`) y cada bloque se escribe en su posición del archivo
+    a medida que llega, de modo que el archivo completo nunca se acumula en memoria.
+    Polars puede luego leerlo con memory-mapping sin copias adicionales.
 
     Utiliza una estrategia de reintentos para manejar errores transitorios de red,
     haciendo la descarga más robusta.
@@ -53,11 +59,15 @@ async def download_parquet_file_to_buffer(client: DataLakeServiceClient) -> io.B
         client: El cliente de DataLakeServiceClient.
 
     Returns:
-        Un buffer de BytesIO que contiene los datos del archivo Parquet.
+        La ruta del archivo temporal que contiene los datos del archivo Parquet.
+        Quien llama es responsable de eliminarlo.
 
     Raises:
         Exception: Si la descarga falla después de todos los reintentos.
     """
+    tmp = tempfile.NamedTemporaryFile(
+        suffix=".parquet", dir=settings.PARQUET_DOWNLOAD_DIR, delete=False
+    )
     try:
         logger.info(f"Iniciando la descarga del archivo: {settings.PARQUET_FILE_PATH}")
         file_client = client.get_file_client(
@@ -65,14 +75,21 @@ async def download_parquet_file_to_buffer(client: DataLakeServiceClient) -> io.B
             settings.PARQUET_FILE_PATH
         )
 
-        # Descargar el contenido del archivo
-        download = await file_client.download_file()
-        file_bytes = await download.readall()
+        # Descargar el contenido del archivo por rangos en paralelo directamente a disco
+        download = await file_client.download_file(
+            max_concurrency=settings.ADLS_DOWNLOAD_CONCURRENCY
+        )
+        with tmp:
+            await download.readinto(tmp)
+            tmp.flush()
+            os.fsync(tmp.fileno())
 
-        logger.info("Archivo descargado exitosamente en memoria.")
-        return io.BytesIO(file_bytes)
+        logger.info(f"Archivo descargado exitosamente en: {tmp.name}")
+        return tmp.name
     except Exception as e:
         logger.error(f"Error al descargar el archivo desde ADLS: {e}", exc_info=True)
+        tmp.close()
+        os.remove(tmp.name)
         # La anotación @retry se encargará de reintentar y, si falla, relanzará la excepción.
         raise
     finally:
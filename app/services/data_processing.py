@@ -1,28 +1,48 @@
+import os
+import asyncio
 import logging
 import time
+from dataclasses import dataclass
+import orjson
 import polars as pl
-from typing import Dict, Any, Optional
+import pyarrow.parquet as pq
+from typing import Callable, Dict, Any, List, Optional, Tuple
 
 from app.core.config import settings
-from app.services.adls import get_adls_client, download_parquet_file_to_buffer
+from app.services.adls import get_adls_client, download_parquet_file_to_path
 
 # Configurar un logger específico para este módulo
 logger = logging.getLogger(__name__)
 
-# Usamos un diccionario como un simple almacén de datos en memoria.
+# Usamos una instancia única de DataStore como almacén de datos en memoria.
 # Esto sigue un patrón similar a un Singleton y es accesible desde toda la aplicación.
-data_store: Dict[str, Any] = {
-    "dataframe": None,      # Contendrá el DataFrame principal de Polars
-    "filter_index": None, # Contendrá nuestro índice de hash para búsquedas rápidas
-    "stats": None,          # Contendrá estadísticas precalculadas del dataset
-}
+# Con `slots=True` cada campo es un atributo de acceso directo en lugar de una
+# entrada de diccionario, lo que abarata su lectura en cada petición.
+@dataclass(slots=True)
+class DataStore:
+    filter_field: Optional[str] = None  # Nombre de la columna sobre la que se construyó el índice
+    payload_cache: Optional[Dict[Any, Tuple[bytes, int]]] = None  # Índice de hash (clave -> (JSON de sus registros, total))
+    coerce: Optional[Callable[[str], Any]] = None  # Convierte el valor recibido al tipo de la columna de filtro
+    stats: Optional[Dict[str, Any]] = None  # Contendrá estadísticas precalculadas del dataset
+    ready: bool = False  # Se activa cuando la carga completa (datos, índice y estadísticas) ha terminado
+
+data_store = DataStore()
+
+# Rango de valores representable con Int32, usado para reducir columnas Int64.
+_INT32_MIN, _INT32_MAX = -(2**31), 2**31 - 1
+
+# Columna auxiliar con el JSON de cada fila, usada al construir el índice.
+_ROW_JSON_COLUMN = "__row_json__"
+
+# Formato ISO 8601 para fechas sin zona horaria (`%.f` omite la fracción si es cero).
+_ISO_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S%.f"
 
 async def load_data_into_memory():
     """
     Función principal que se ejecuta al inicio de la aplicación.
 
-    Orquesta la descarga del archivo Parquet desde ADLS, lo carga en un DataFrame de Polars,
-    y crea un índice en memoria (hash map) para acelerar las consultas de filtrado.
+    Orquesta la descarga del archivo Parquet desde ADLS a disco, lo carga en un DataFrame
+    de Polars y crea un índice en memoria (hash map) para acelerar las consultas de filtrado.
     """
     logger.info("Iniciando el proceso de carga de datos en memoria.")
     start_time = time.time()
@@ -31,13 +51,33 @@ async def load_data_into_memory():
         # 1. Obtener el cliente de ADLS
         adls_client = await get_adls_client()
 
-        # 2. Descargar el archivo a un buffer en memoria
-        parquet_buffer = await download_parquet_file_to_buffer(adls_client)
+        # 2. Descargar el archivo por bloques a un archivo temporal en disco
+        parquet_path = await download_parquet_file_to_path(adls_client)
 
-        # 3. Cargar el buffer en un DataFrame de Polars
-        logger.info("Decodificando el archivo Parquet con Polars.")
-        df = pl.read_parquet(parquet_buffer)
-        data_store["dataframe"] = df
+        # 3. Cargar el archivo en un DataFrame de Polars. PyArrow lee el archivo local
+        # con memory-mapping, agrupa las lecturas de cada row group (pre_buffer) y
+        # decodifica las columnas en paralelo. Polars reutiliza los buffers de Arrow de
+        # las columnas numéricas; las de texto sí se copian al convertirse a su tipo String.
+        logger.info("Decodificando el archivo Parquet con PyArrow.")
+        try:
+            table = await asyncio.to_thread(
+                pq.read_table,
+                parquet_path,
+                columns=settings.PROJECTION_COLUMNS,  # Solo las columnas que la aplicación sirve
+                use_threads=True,
+                pre_buffer=True,
+                memory_map=True,
+            )
+        finally:
+            # Los datos ya están decodificados en memoria; el archivo ya no es necesario.
+            os.remove(parquet_path)
+        df = pl.from_arrow(table, rechunk=False)
+        # Liberamos la tabla para que los buffers que Polars no comparte no sigan en
+        # memoria mientras se construye el índice.
+        del table
+
+        # Reducir el tamaño en memoria del DataFrame antes de indexarlo
+        df = _reduce_memory_usage(df)
 
         logger.info(f"DataFrame cargado. Columnas: {df.columns}, Filas: {df.height}")
         logger.info(f"Uso de memoria del DataFrame: {df.estimated_size('mb'):.2f} MB")
@@ -45,8 +85,17 @@ async def load_data_into_memory():
         # 4. Crear el índice de hash para filtrado rápido
         _create_filter_index(df)
 
-        # 5. Pre-calcular estadísticas
+        # 5. Pre-calcular estadísticas. Las consultas se sirven desde el índice, así que
+        # después el DataFrame ya no es necesario y se libera.
         _calculate_stats(df)
+        del df
+
+        # 6. Ejecutar una consulta de calentamiento para que la primera petición real
+        # no pague los fallos de página iniciales ni la inicialización de orjson
+        _warm_up()
+
+        # 7. Marcar el servicio como listo, solo cuando todo lo anterior está disponible
+        data_store.ready = True
 
         end_time = time.time()
         logger.info(f"Proceso de carga de datos completado exitosamente en {end_time - start_time:.2f} segundos.")
@@ -56,10 +105,53 @@ async def load_data_into_memory():
         # Es crucial relanzar la excepción para que FastAPI sepa que el inicio falló.
         raise
 
+def _reduce_memory_usage(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Reduce la memoria que ocupa el DataFrame usando tipos de datos más compactos.
+
+    - Las columnas `Int64` cuyos valores caben en 32 bits se convierten a `Int32`.
+    - Las columnas de texto con pocos valores distintos (menos de un 10% de las filas)
+      se convierten a `Categorical`, que guarda cada texto distinto una sola vez.
+
+    Args:
+        df: El DataFrame de Polars recién cargado.
+
+    Returns:
+        El DataFrame con los tipos reducidos y los buffers ajustados a su tamaño.
+    """
+    int_columns = [name for name, dtype in df.schema.items() if dtype == pl.Int64]
+    str_columns = [name for name, dtype in df.schema.items() if dtype == pl.String]
+    if not df.is_empty() and (int_columns or str_columns):
+        # Calculamos todos los rangos y cardinalidades en una sola pasada.
+        summary = df.select(
+            [pl.col(c).min().alias(f"{c}_min") for c in int_columns]
+            + [pl.col(c).max().alias(f"{c}_max") for c in int_columns]
+            + [pl.col(c).n_unique().alias(f"{c}_n_unique") for c in str_columns]
+        ).row(0, named=True)
+
+        casts = [
+            pl.col(c).cast(pl.Int32)
+            for c in int_columns
+            if summary[f"{c}_min"] is not None
+            and _INT32_MIN <= summary[f"{c}_min"]
+            and summary[f"{c}_max"] <= _INT32_MAX
+        ] + [
+            pl.col(c).cast(pl.Categorical)
+            for c in str_columns
+            if summary[f"{c}_n_unique"] < df.height // 10
+        ]
+        if casts:
+            df = df.with_columns(casts)
+
+    return df.shrink_to_fit()
+
 def _create_filter_index(df: pl.DataFrame):
     """
     Crea un índice de hash (diccionario) para búsquedas ultra-rápidas.
 
+    Para cada valor de la columna de filtro guarda el JSON ya serializado de sus
+    registros y cuántos son. El DataFrame no se guarda en el almacén.
+
     Args:
         df: El DataFrame de Polars principal.
     """
@@ -69,50 +161,170 @@ def _create_filter_index(df: pl.DataFrame):
 
     logger.info(f"Creando índice en memoria para la columna: '{filter_column}'...")
 
-    # Usamos group_by para crear un iterador de (clave, sub-dataframe).
-    # La clave que devuelve group_by es una tupla, por lo que usamos key[0] para obtener el valor escalar.
-    data_store["filter_index"] = {
-        key[0]: group_df for key, group_df in df.group_by(filter_column)
-    }
+    # Calculamos el número de registros de cada clave y su JSON en un único group_by,
+    # que Polars ejecuta en paralelo en su pool de hilos. Dentro de cada grupo las filas
+    # conservan el orden que tienen en el archivo.
+    # El JSON se genera una única vez porque el dataset es de solo lectura: las consultas
+    # devuelven estos bytes tal cual, sin convertir el DataFrame a diccionarios de Python.
+    # Para limitar la memoria temporal, solo se conservan la clave y el JSON de cada fila,
+    # los corchetes de cada lista se añaden dentro de Polars y el resultado se convierte
+    # a `Binary`, de modo que `to_list()` entrega directamente los `bytes` finales.
+    groups_lf = (
+        df.lazy()
+        .with_columns(_json_compatible_columns(df.schema))
+        .select(
+            pl.col(filter_column),
+            pl.struct(pl.all()).struct.json_encode().alias(_ROW_JSON_COLUMN),
+        )
+        .group_by(filter_column)
+        .agg(
+            pl.len().alias("length"),
+            pl.concat_str([
+                pl.lit("["),
+                pl.col(_ROW_JSON_COLUMN).str.join(","),
+                pl.lit("]"),
+            ]).cast(pl.Binary).alias("payload"),
+        )
+    )
+    try:
+        groups = groups_lf.collect()
+    except pl.exceptions.ComputeError as e:
+        # El caso esperado es una columna binaria que no contiene texto UTF-8 válido.
+        raise ValueError(f"No se pudieron serializar a JSON los registros del archivo Parquet: {e}") from e
+
+    payload_cache: Dict[Any, Tuple[bytes, int]] = dict(zip(
+        groups[filter_column].to_list(),
+        zip(groups["payload"].to_list(), groups["length"].to_list()),
+    ))
+    del groups
 
-    logger.info(f"Índice creado con {len(data_store['filter_index'])} claves únicas.")
+    data_store.filter_field = filter_column
+    data_store.payload_cache = payload_cache
+    data_store.coerce = _get_coercer(df.schema[filter_column])
+
+    logger.info(f"Índice creado con {len(payload_cache)} claves únicas.")
+
+def _json_compatible_columns(schema: pl.Schema) -> List[pl.Expr]:
+    """
+    Prepara las columnas cuyo JSON generado por Polars no coincide con el de la API.
+
+    - Los valores `Datetime` sin zona horaria se convierten a texto ISO 8601
+      (`2024-01-02T03:04:05.123456`), también dentro de columnas `List`, `Array` o
+      `Struct`; Polars los escribiría con un espacio en lugar de `T`.
+    - Las columnas `Binary` se convierten a texto UTF-8, como hacía Pydantic. Polars no
+      sabe escribirlas a JSON (entra en pánico), así que los tipos anidados que contienen
+      datos binarios se rechazan con un error claro.
+
+    Args:
+        schema: El esquema del DataFrame a serializar.
+
+    Returns:
+        Las expresiones a aplicar con `with_columns` antes de codificar cada fila a JSON.
+
+    Raises:
+        ValueError: Si alguna columna anidada contiene datos binarios.
+    """
+    expressions = []
+    for name, dtype in schema.items():
+        if dtype == pl.Binary:
+            expressions.append(pl.col(name).cast(pl.String))
+        elif _contains_binary(dtype):
+            raise ValueError(
+                f"La columna '{name}' ({dtype}) contiene datos binarios anidados, que no se pueden servir como JSON."
+            )
+        else:
+            expression = _iso_datetimes(pl.col(name), dtype)
+            if expression is not None:
+                expressions.append(expression)
+    return expressions
+
+def _iso_datetimes(expr: pl.Expr, dtype: pl.DataType) -> Optional[pl.Expr]:
+    """
+    Convierte a texto ISO 8601 los valores `Datetime` sin zona horaria de `expr`,
+    recorriendo los tipos anidados igual que `_contains_binary`.
+
+    Returns:
+        La expresión convertida, o `None` si el tipo no contiene ningún `Datetime` a convertir.
+    """
+    if isinstance(dtype, pl.Datetime):
+        return expr.dt.to_string(_ISO_DATETIME_FORMAT) if dtype.time_zone is None else None
+    if isinstance(dtype, (pl.List, pl.Array)):
+        inner = _iso_datetimes(pl.element(), dtype.inner)
+        if inner is None:
+            return None
+        return expr.list.eval(inner) if isinstance(dtype, pl.List) else expr.arr.eval(inner)
+    if isinstance(dtype, pl.Struct):
+        fields = [
+            converted.alias(field.name)
+            for field in dtype.fields
+            if (converted := _iso_datetimes(pl.field(field.name), field.dtype)) is not None
+        ]
+        return expr.struct.with_fields(fields) if fields else None
+    return None
+
+def _contains_binary(dtype: pl.DataType) -> bool:
+    """Indica si un tipo de dato es binario o lo contiene a cualquier nivel de anidamiento."""
+    if dtype == pl.Binary:
+        return True
+    if isinstance(dtype, (pl.List, pl.Array)):
+        return _contains_binary(dtype.inner)
+    if isinstance(dtype, pl.Struct):
+        return any(_contains_binary(field.dtype) for field in dtype.fields)
+    return False
+
+def _get_coercer(dtype: pl.DataType) -> Callable[[str], Any]:
+    """
+    Elige, según el tipo de la columna de filtro, cómo convertir el valor de la consulta.
+
+    El tipo de la columna no cambia en tiempo de ejecución, así que se resuelve una
+    sola vez al crear el índice en lugar de probar conversiones en cada petición.
+    """
+    if dtype.is_integer():
+        return int
+    if dtype.is_float():
+        return float
+    return str
+
+def _warm_up():
+    """
+    Recorre una vez el camino de una consulta real con una clave cualquiera del índice.
+
+    Se ejecuta lo mismo que hace `/data/filter` en cada petición: la consulta al
+    `payload_cache` y la serialización de la respuesta con orjson. Así esas páginas de
+    memoria y orjson ya están inicializados cuando llega la primera petición real.
+    """
+    if not data_store.payload_cache:
+        return
+    key = next(iter(data_store.payload_cache))
+    payload, total_records = data_store.payload_cache[key]
+    orjson.dumps({
+        "data": orjson.Fragment(payload),
+        "total_records": total_records,
+        "query_time_ms": 0.0,
+        "timestamp": 0,
+    })
+    logger.info("Consulta de calentamiento completada.")
 
 def _calculate_stats(df: pl.DataFrame):
     """
     Calcula y almacena estadísticas básicas sobre el DataFrame.
     """
     logger.info("Calculando estadísticas del dataset...")
+    # El número de columnas, sus nombres y sus tipos salen de una única lectura del esquema.
+    schema = df.schema
     stats = {
         "total_records": df.height,
-        "total_columns": df.width,
-        "columns": df.columns,
+        "total_columns": len(schema),
+        "columns": list(schema.names()),
         "memory_usage_mb": df.estimated_size('mb'),
-        "schema": {name: str(dtype) for name, dtype in df.schema.items()},
+        "schema": {name: str(dtype) for name, dtype in schema.items()},
     }
-    data_store["stats"] = stats
+    data_store.stats = stats
     logger.info("Estadísticas calculadas y almacenadas.")
 
 
 # --- Funciones de acceso a los datos ---
 
-def get_dataframe() -> Optional[pl.DataFrame]:
-    """Devuelve el DataFrame principal."""
-    return data_store["dataframe"]
-
 def get_stats() -> Optional[Dict[str, Any]]:
     """Devuelve las estadísticas precalculadas."""
-    return data_store["stats"]
-
-def find_records_by_value(value: Any) -> Optional[pl.DataFrame]:
-    """
-    Busca registros usando el índice de hash pre-calculado.
-    Esta función es la clave para la alta velocidad de respuesta.
-
-    Args:
-        value: El valor a buscar en la columna de filtro.
-
-    Returns:
-        Un DataFrame de Polars con los registros encontrados, o None si no se encuentra.
-    """
-    # La búsqueda en el diccionario es, en promedio, O(1)
-    return data_store["filter_index"].get(value)
+    return data_store.stats
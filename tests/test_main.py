@@ -1,7 +1,11 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, MagicMock
+import asyncio
 import os
+import shutil
+import tenacity
+from datetime import datetime
 
 # --- Configuración Inicial ---
 # Establecer una variable de entorno ANTES de que se importen los módulos de la app.
@@ -13,8 +17,8 @@ os.environ['PARQUET_FILE_PATH'] = 'test/path.parquet'
 
 # Ahora importamos la app y otros componentes
 from app.main import app
-from app.services.data_processing import data_store, _create_filter_index, _calculate_stats
-from app.api.endpoints import _execute_filter
+from app.services.adls import download_parquet_file_to_path
+from app.services.data_processing import data_store, _create_filter_index, _calculate_stats, _reduce_memory_usage
 import polars as pl
 
 # --- Fixture de Pytest para Configuración de Pruebas ---
@@ -33,26 +37,31 @@ def test_app(monkeypatch):
 
     # 2. Cargar los datos de prueba desde el archivo Parquet local.
     # Esto simula el estado de la aplicación DESPUÉS de un inicio exitoso.
-    test_data_path = os.path.join(os.path.dirname(__file__), "test_data.parquet")
-    df = pl.read_parquet(test_data_path)
+    df = _read_test_data()
 
     # 3. Poblar manualmente el data_store, tal como lo haría la aplicación real.
-    data_store["dataframe"] = df
-    _create_filter_index(df) # Crear el índice de filtro con los datos de prueba
+    _create_filter_index(df) # Crear el índice de filtro
     _calculate_stats(df)     # Calcular estadísticas con los datos de prueba
+    data_store.ready = True  # Marcar la carga como completada
 
-    # 4. Limpiar la caché antes de cada prueba para asegurar el aislamiento.
-    _execute_filter.cache_clear()
-
-    # 5. Crear y devolver el cliente de prueba.
+    # 4. Crear y devolver el cliente de prueba.
     with TestClient(app) as client:
         yield client
 
     # 5. Limpieza (se ejecuta después de que la prueba termina).
-    # Reseteamos el data_store para asegurar que las pruebas estén aisladas.
-    data_store["dataframe"] = None
-    data_store["filter_index"] = None
-    data_store["stats"] = None
+    _reset_data_store()
+
+def _read_test_data() -> pl.DataFrame:
+    """Lee el archivo Parquet de prueba local."""
+    return pl.read_parquet(os.path.join(os.path.dirname(__file__), "test_data.parquet"))
+
+def _reset_data_store():
+    """Resetea el data_store para asegurar que las pruebas estén aisladas."""
+    data_store.filter_field = None
+    data_store.payload_cache = None
+    data_store.coerce = None
+    data_store.stats = None
+    data_store.ready = False
 
 
 # --- Casos de Prueba ---
@@ -73,8 +82,8 @@ def test_health_check_success(test_app):
 
 def test_health_check_fail(test_app):
     """Prueba el endpoint de health cuando los datos NO están cargados."""
-    # Simular fallo de carga de datos vaciando el dataframe
-    data_store["dataframe"] = None
+    # Simular que la carga de datos no ha terminado
+    data_store.ready = False
 
     response = test_app.get("/api/health")
     assert response.status_code == 503
@@ -102,6 +111,8 @@ def test_filter_endpoint_success(test_app):
     for record in json_response["data"]:
         assert record["country_code"] == "US"
     assert "query_time_ms" in json_response
+    # El timestamp se devuelve como epoch en milisegundos
+    assert isinstance(json_response["timestamp"], int)
 
 def test_filter_endpoint_not_found(test_app):
     """Prueba el endpoint de filtro con un valor que NO existe."""
@@ -112,6 +123,18 @@ def test_filter_endpoint_not_found(test_app):
     assert json_response["total_records"] == 0
     assert len(json_response["data"]) == 0
 
+def test_count_endpoint(test_app):
+    """Prueba el endpoint de conteo con un valor que existe y otro que no."""
+    response = test_app.get("/api/data/count?value=US")
+    assert response.status_code == 200
+    json_response = response.json()
+    assert json_response["total_records"] == 3
+    assert "data" not in json_response
+
+    response = test_app.get("/api/data/count?value=JP")
+    assert response.status_code == 200
+    assert response.json()["total_records"] == 0
+
 def test_filter_endpoint_numeric_value(test_app, monkeypatch):
     """Prueba el endpoint de filtro con un campo numérico."""
     # 1. Parcheamos directamente el objeto de settings.
@@ -120,8 +143,7 @@ def test_filter_endpoint_numeric_value(test_app, monkeypatch):
 
     # 2. Volvemos a crear el índice con la nueva columna de filtro.
     # Es importante hacerlo DESPUÉS de parchear la configuración.
-    df = data_store["dataframe"]
-    _create_filter_index(df)
+    _create_filter_index(_read_test_data())
 
     # 3. Realizamos la prueba.
     # El endpoint debe poder manejar un valor numérico como string.
@@ -132,3 +154,178 @@ def test_filter_endpoint_numeric_value(test_app, monkeypatch):
     assert json_response["total_records"] == 2
     assert json_response["data"][0]["client_id"] == 101
     assert json_response["data"][1]["client_id"] == 101
+
+def test_filter_endpoint_invalid_numeric_value(test_app, monkeypatch):
+    """Prueba que un valor no numérico sobre un campo numérico devuelve 422."""
+    monkeypatch.setattr("app.core.config.settings.FILTER_FIELD_NAME", "client_id")
+    _create_filter_index(_read_test_data())
+
+    response = test_app.get("/api/data/filter?value=abc")
+    assert response.status_code == 422
+    assert "client_id" in response.json()["detail"]
+
+def test_filter_endpoint_datetime_and_binary_columns(test_app):
+    """Prueba que las columnas Datetime se sirven en ISO 8601 y las Binary como texto."""
+    df = pl.DataFrame({
+        "country_code": ["US", "US", "CA"],
+        "created_at": [datetime(2024, 1, 2, 3, 4, 5, 123456), datetime(2024, 1, 2, 3, 4, 5), None],
+        "raw": [b"abc", b"", None],
+    })
+    _create_filter_index(df)
+
+    response = test_app.get("/api/data/filter?value=US")
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data[0]["created_at"] == "2024-01-02T03:04:05.123456"
+    assert data[1]["created_at"] == "2024-01-02T03:04:05"
+    assert [record["raw"] for record in data] == ["abc", ""]
+
+def test_filter_endpoint_nested_datetime_columns(test_app):
+    """Prueba que los Datetime dentro de columnas List y Struct también se sirven en ISO 8601."""
+    moment = datetime(2024, 1, 2, 3, 4, 5)
+    df = pl.DataFrame({
+        "country_code": ["US", "US"],
+        "events": [[moment, None], None],
+        "audit": [{"created_at": moment, "version": 1}, None],
+    })
+    assert df.schema["events"] == pl.List(pl.Datetime)
+    _create_filter_index(df)
+
+    response = test_app.get("/api/data/filter?value=US")
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data[0]["events"] == ["2024-01-02T03:04:05", None]
+    assert data[0]["audit"] == {"created_at": "2024-01-02T03:04:05", "version": 1}
+    assert data[1]["events"] is None
+    assert data[1]["audit"] is None
+
+def test_create_filter_index_rejects_invalid_binary():
+    """Prueba que los datos binarios que no se pueden servir como JSON dan un error claro."""
+    df = pl.DataFrame({"country_code": ["US"], "raw": [b"\xff"]})
+    with pytest.raises(ValueError, match="JSON"):
+        _create_filter_index(df)
+
+    nested = pl.DataFrame({"country_code": ["US"], "raw": [[b"abc"]]})
+    with pytest.raises(ValueError, match="raw"):
+        _create_filter_index(nested)
+
+def test_reduce_memory_usage():
+    """Prueba la reducción de tipos: Int64 -> Int32, texto repetido -> Categorical."""
+    rows = 100
+    df = pl.DataFrame({
+        "small_int": list(range(rows)),
+        "big_int": [2**40 + i for i in range(rows)],
+        "country_code": ["US", "CA", "MX", "US"] * (rows // 4),
+        "unique_text": [f"id-{i}" for i in range(rows)],
+    })
+
+    reduced = _reduce_memory_usage(df)
+
+    assert reduced.schema["small_int"] == pl.Int32
+    assert reduced.schema["big_int"] == pl.Int64  # Fuera del rango de Int32: no se reduce
+    assert reduced.schema["country_code"] == pl.Categorical
+    assert reduced.schema["unique_text"] == pl.String
+    assert reduced["small_int"].to_list() == df["small_int"].to_list()
+    assert reduced["country_code"].cast(pl.String).to_list() == df["country_code"].to_list()
+
+def test_filter_endpoint_categorical_column(test_app):
+    """Prueba el endpoint de filtro cuando la columna de filtro se convierte a Categorical."""
+    rows = 100
+    df = _reduce_memory_usage(pl.DataFrame({
+        "client_id": list(range(rows)),
+        "country_code": ["US", "CA", "MX", "US"] * (rows // 4),
+    }))
+    assert df.schema["country_code"] == pl.Categorical
+    _create_filter_index(df)
+
+    response = test_app.get("/api/data/filter?value=US")
+    assert response.status_code == 200
+    json_response = response.json()
+    assert json_response["total_records"] == 50
+    assert all(record["country_code"] == "US" for record in json_response["data"])
+    assert isinstance(json_response["data"][0]["client_id"], int)
+
+def test_startup_loads_data(monkeypatch, tmp_path):
+    """
+    Prueba la secuencia de inicio completa con ADLS mockeado: lectura del archivo
+    descargado, índice, estadísticas, calentamiento y borrado del archivo temporal.
+    """
+    downloaded_path = tmp_path / "download.parquet"
+
+    async def fake_download(client):
+        # Simula la descarga copiando el archivo de prueba a un archivo temporal
+        shutil.copy(os.path.join(os.path.dirname(__file__), "test_data.parquet"), downloaded_path)
+        return str(downloaded_path)
+
+    monkeypatch.setattr("app.services.data_processing.get_adls_client", AsyncMock())
+    monkeypatch.setattr("app.services.data_processing.download_parquet_file_to_path", fake_download)
+
+    try:
+        # Al entrar en el TestClient se ejecuta el evento de inicio real
+        with TestClient(app) as client:
+            assert data_store.ready is True
+            assert not downloaded_path.exists()
+
+            response = client.get("/api/health")
+            assert response.status_code == 200
+
+            response = client.get("/api/data/filter?value=US")
+            assert response.status_code == 200
+            assert response.json()["total_records"] == 3
+
+            # client_id (Int64 con valores pequeños) se reduce a Int32 al cargar
+            assert client.get("/api/stats").json()["schema"]["client_id"] == "Int32"
+    finally:
+        _reset_data_store()
+
+def _mock_adls_client(download_file: AsyncMock) -> MagicMock:
+    """Crea un cliente de ADLS mockeado cuyo file client usa el `download_file` dado."""
+    client = MagicMock()
+    client.get_file_client.return_value.download_file = download_file
+    client.close = AsyncMock()
+    return client
+
+def test_download_parquet_file_to_path(monkeypatch, tmp_path):
+    """Prueba que la descarga usa la concurrencia configurada y escribe y sincroniza el archivo."""
+    monkeypatch.setattr("app.core.config.settings.PARQUET_DOWNLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr("app.core.config.settings.ADLS_DOWNLOAD_CONCURRENCY", 3)
+    fsync = MagicMock(wraps=os.fsync)
+    monkeypatch.setattr("app.services.adls.os.fsync", fsync)
+
+    async def readinto(stream):
+        stream.write(b"PAR1 contenido")
+
+    download = MagicMock()
+    download.readinto = AsyncMock(side_effect=readinto)
+    download_file = AsyncMock(return_value=download)
+    client = _mock_adls_client(download_file)
+
+    path = asyncio.run(download_parquet_file_to_path(client))
+
+    download_file.assert_awaited_once_with(max_concurrency=3)
+    fsync.assert_called_once()
+    assert os.path.dirname(path) == str(tmp_path)
+    with open(path, "rb") as f:
+        assert f.read() == b"PAR1 contenido"
+    client.close.assert_awaited_once()
+
+@pytest.mark.parametrize("failing_step", ["download_file", "readinto"])
+def test_download_parquet_file_to_path_cleans_up_on_error(monkeypatch, tmp_path, failing_step):
+    """Prueba que el archivo temporal se elimina si la descarga falla."""
+    monkeypatch.setattr("app.core.config.settings.PARQUET_DOWNLOAD_DIR", str(tmp_path))
+
+    download = MagicMock()
+    if failing_step == "download_file":
+        download_file = AsyncMock(side_effect=ConnectionError("sin conexión"))
+    else:
+        download.readinto = AsyncMock(side_effect=ConnectionError("sin conexión"))
+        download_file = AsyncMock(return_value=download)
+    client = _mock_adls_client(download_file)
+
+    # Un solo intento, para no esperar entre los reintentos
+    download_once = download_parquet_file_to_path.retry_with(stop=tenacity.stop_after_attempt(1))
+    with pytest.raises(ConnectionError):
+        asyncio.run(download_once(client))
+
+    assert list(tmp_path.iterdir()) == []
+    client.close.assert_awaited_once()